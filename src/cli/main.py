@@ -1,57 +1,154 @@
 import typer
 import asyncio
+import random
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
 from rich.console import Console
+from rich.live import Live
 from rich.panel import Panel
 from rich.markdown import Markdown
 from rich.prompt import Prompt
 from rich.progress import Progress, SpinnerColumn, TextColumn
 from dotenv import load_dotenv
 
-# Load ENV before imports that might check it
-load_dotenv()
-
-from src.core.session import SessionManager
-from src.graphs.main import create_main_graph
+# Heavy imports (LangGraph, LLM clients, SQLite saver) are deferred to the
+# commands that need them, so `2g version` and shell completion stay fast.
 
 app = typer.Typer(name="2g", help="Agentic CLI")
 console = Console()
 
-def run_graph_sync(graph, input_message: str, config: dict):
-    """Refactored async wrapper for sync typer."""
-    
+_env_loaded = False
+
+def _load_env():
+    """Load .env exactly once, before imports that might check it."""
+    global _env_loaded
+    if not _env_loaded:
+        load_dotenv()
+        _env_loaded = True
+
+# Truncate the SQLite WAL every N turns so it cannot grow unbounded
+WAL_CHECKPOINT_EVERY = 20
+
+@dataclass
+class SessionState:
+    """CLI-side bookkeeping for one interactive session."""
+    # execution_history entries already shown to the user
+    printed_history_len: int = 0
+
+# Nodes whose LLM output is the user-facing answer: their tokens are rendered live
+STREAMED_NODES = {"chat_node", "drafter"}
+
+def run_graph_sync(graph, input_message: Optional[str], config: dict) -> Tuple[Optional[dict], bool]:
+    """
+    Run the graph, streaming answer tokens to the terminal as they arrive.
+    Pass input_message=None to resume from the last checkpoint.
+    Returns (final_state, streamed): streamed is True if the answer was already rendered.
+    """
+    graph_input = {"messages": [("user", input_message)]} if input_message is not None else None
+    # subgraphs=True: drafter runs inside the researcher sub-graph, its tokens
+    # would not reach this loop otherwise
     events = graph.stream(
-        {"messages": [("user", input_message)]},
+        graph_input,
         config,
-        stream_mode="values"
+        stream_mode=["values", "messages"],
+        subgraphs=True,
     )
     
     final_state = None
+    answer_parts = []
+    live = None
+    # No spinner or live rendering when piped / in CI: it would only burn CPU
+    interactive = console.is_terminal
     with Progress(
         SpinnerColumn(),
         TextColumn("[progress.description]{task.description}"),
         transient=True,
+        refresh_per_second=4,
+        disable=not interactive,
     ) as progress:
-        task_id = progress.add_task(description="Thinking...", total=None)
+        last_desc = "Thinking..."
+        task_id = progress.add_task(description=last_desc, total=None)
         
-        for event in events:
-            final_state = event
-            
-            if "plan" in event and event.get("current_step_index", 0) > 0:
-                progress.update(task_id, description="Executing plan...")
-            elif "research_outputs" in event:
-                progress.update(task_id, description="Researching...")
-            elif "_route_target" in event:
-                 progress.update(task_id, description=f"Routing to {event['_route_target']}...")
+        try:
+            for namespace, mode, payload in events:
+                if mode == "messages":
+                    if not interactive:
+                        continue
+                    chunk, metadata = payload
+                    if metadata.get("langgraph_node") not in STREAMED_NODES:
+                        continue
+                    text = getattr(chunk, "text", "")
+                    if not text:
+                        continue
+                    if live is None:
+                        # Only one live display at a time: hand over from the spinner
+                        progress.stop()
+                        live = Live(console=console, refresh_per_second=8)
+                        live.start()
+                    answer_parts.append(text)
+                    live.update(Panel(Markdown("".join(answer_parts)), title="Agent", border_style="green"))
+                    continue
+
+                if namespace:
+                    continue # Sub-graph state: the parent's values event follows
+                event = payload
+                final_state = event
+                
+                desc = last_desc
+                if "plan" in event and event.get("current_step_index", 0) > 0:
+                    desc = "Executing plan..."
+                elif "research_outputs" in event:
+                    desc = "Researching..."
+                elif "_route_target" in event:
+                    desc = f"Routing to {event['_route_target']}..."
+
+                # Only touch the spinner on an actual state transition
+                if desc != last_desc:
+                    progress.update(task_id, description=desc)
+                    last_desc = desc
+        finally:
+            if live is not None:
+                live.stop()
     
-    return final_state
+    return final_state, live is not None
+
+# Transient failures worth re-running the turn for: HTTP 503/504 from the
+# LLM client (unavailable, deadline) and a locked SQLite checkpoint DB.
+# Quota errors (429) are not: llm_invoke already retries them with backoff.
+# Anything else is permanent and reported to the user straight away.
+_RETRYABLE_STATUS = {503, 504}
+MAX_TURN_ATTEMPTS = 3
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, sqlite3.OperationalError):
+        return "database is locked" in str(exc)
+    return getattr(exc, "code", None) in _RETRYABLE_STATUS
 
-def display_output(state: dict):
+def run_graph_with_retry(graph, input_message: Optional[str], config: dict) -> Tuple[Optional[dict], bool]:
+    """run_graph_sync, retried with exponential backoff on transient errors."""
+    for attempt in range(MAX_TURN_ATTEMPTS):
+        try:
+            return run_graph_sync(graph, input_message, config)
+        except Exception as e:
+            if attempt == MAX_TURN_ATTEMPTS - 1 or not _is_retryable(e):
+                raise
+            delay = (2 ** attempt) + random.random()
+            console.print(f"[yellow]Transient error ({e.__class__.__name__}), retrying in {delay:.1f}s...[/yellow]")
+            time.sleep(delay)
+            # The user message is already checkpointed: resume the failed node
+            # instead of sending the message a second time.
+            if graph.get_state(config).next:
+                input_message = None
+
+def display_output(state: dict, session: SessionState, show_message: bool = True):
     """Render the final state to the user."""
     if not state:
         return
 
     messages = state.get("messages", [])
-    if messages:
+    if messages and show_message:
         # Only show the last message which is the AI response
         last_msg = messages[-1]
         if hasattr(last_msg, 'content') and last_msg.type == 'ai':
@@ -62,20 +159,25 @@ def display_output(state: dict):
                   
              console.print(Panel(Markdown(str(text_content)), title="Agent", border_style="green"))
 
+    # Only print entries added since the last call: history spans the whole session
     execution_history = state.get("execution_history", [])
-    if execution_history:
+    new_items = execution_history[session.printed_history_len:]
+    session.printed_history_len = len(execution_history)
+    if new_items:
         console.print("\n[bold]Execution Log:[/bold]")
-        for item in execution_history:
+        for item in new_items:
             status_color = "green" if item.get("return_code") == 0 else "red"
             console.print(f"[{status_color}]➜ {item.get('command')}[/{status_color}]")
-            if item.get("output"):
-                 console.print(f"[dim]{item.get('output').strip()}[/dim]")
+            for stream in ("stdout", "stderr"):
+                text = item.get(stream)
+                if text and text.strip():
+                    console.print(f"[dim]{text.strip()}[/dim]")
 
-def process_turn(graph, message: str, config: dict, dry_run: bool):
+def process_turn(graph, message: str, config: dict, dry_run: bool, session: SessionState):
     """Process a single turn of conversation/execution."""
     try:
-        final_state = run_graph_sync(graph, message, config)
-        display_output(final_state)
+        final_state, streamed = run_graph_with_retry(graph, message, config)
+        display_output(final_state, session, show_message=not streamed)
         
         # Check if paused (interrupt)
         snapshot = graph.get_state(config)
@@ -86,7 +188,9 @@ def process_turn(graph, message: str, config: dict, dry_run: bool):
             plan = current_state.get("plan", [])
             for step in plan:
                 console.print(f"[bold]{step['id']}. {step['description']}[/bold] ({step['risk_level']})")
-                console.print(f"   [dim]{step['command']}[/dim]")
+                # Manual / thought steps have no command
+                if step.get("command"):
+                    console.print(f"   [dim]{step['command']}[/dim]")
             
             if dry_run:
                 console.print("[blue]Dry run complete.[/blue]")
@@ -99,11 +203,8 @@ def process_turn(graph, message: str, config: dict, dry_run: bool):
                 graph.update_state(config, {"user_validated": True})
                 
                 console.print("[green]Resuming execution...[/green]")
-                events = graph.stream(None, config, stream_mode="values")
-                for event in events:
-                    final_state = event
-                
-                display_output(final_state)
+                final_state, streamed = run_graph_with_retry(graph, None, config)
+                display_output(final_state, session, show_message=not streamed)
             else:
                 console.print("[red]Execution cancelled. Plan discarded.[/red]")
                 # Ideally we might want to clean up the plan in state?
@@ -125,6 +226,10 @@ def start(
     """
     Start the Agentic CLI in interactive mode.
     """
+    _load_env()
+    from src.core.session import SessionManager
+    from src.graphs.main import create_main_graph
+
     session_manager = SessionManager()
     checkpointer = session_manager.get_checkpointer()
     
@@ -135,12 +240,16 @@ def start(
     ) 
     
     config = {"configurable": {"thread_id": session_id}}
+    # Resumed sessions: don't replay the log of earlier runs
+    existing_history = graph.get_state(config).values.get("execution_history", [])
+    session = SessionState(printed_history_len=len(existing_history))
     
     console.print(f"[bold blue]Welcome to Agentic CLI (2g)[/bold blue]")
     console.print(f"Session: [cyan]{session_id}[/cyan]")
     
     # Interactive mode
     console.print("[dim]Type 'exit' or 'quit' to leave.[/dim]")
+    turns_since_checkpoint = 0
     while True:
         try:
             user_input = Prompt.ask("\n[bold cyan]You[/bold cyan]")
@@ -151,7 +260,14 @@ def start(
             if not user_input.strip():
                 continue
                 
-            process_turn(graph, user_input, config, dry_run)
+            process_turn(graph, user_input, config, dry_run, session)
+
+            turns_since_checkpoint += 1
+            if turns_since_checkpoint >= WAL_CHECKPOINT_EVERY:
+                result = session_manager.checkpoint_wal()
+                # busy != 0 means a reader held the WAL: retry on the next turn
+                if result is None or result[0] == 0:
+                    turns_since_checkpoint = 0
             
         except KeyboardInterrupt:
             console.print("\nExiting...")
@@ -1,14 +1,51 @@
 from langchain_google_genai import ChatGoogleGenerativeAI
 import os
 from dotenv import load_dotenv
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
 
 load_dotenv()
 
-# Singleton LLM instance to be shared across graphs
-# configured with robust retry logic for "RESOURCE_EXHAUSTED" (429) errors.
-llm = ChatGoogleGenerativeAI(
+# Singleton LLM instances to be shared across graphs.
+# Quota errors ("RESOURCE_EXHAUSTED" / 429) are retried by llm_invoke below,
+# the SDK only keeps a couple of retries for transient network failures.
+
+# Planner / chat / drafter: bounded output so long answers can't run away.
+# The cap includes thinking tokens (see below): thinking is kept low and the cap
+# sized for it, so a plan's JSON or a drafted answer isn't cut off.
+llm_main = ChatGoogleGenerativeAI(
     model="gemini-3-flash-preview",
     temperature=0,
-    max_retries=10, # Aggressive retries for free tier/preview limits
+    max_retries=2,
+    max_output_tokens=8192,
+    thinking_level="low",
     request_timeout=60,
 )
+
+# Router / grader: one-word answers, so generation stops almost immediately.
+# Gemini 3 counts thinking tokens against max_output_tokens: thinking is kept
+# minimal and the cap leaves headroom, otherwise the answer comes back empty.
+llm_classifier = ChatGoogleGenerativeAI(
+    model="gemini-3-flash-preview",
+    temperature=0,
+    max_retries=2,
+    max_output_tokens=256,
+    thinking_level="minimal",
+    request_timeout=10,
+)
+
+llm = llm_main
+
+def _is_rate_limited(exc: BaseException) -> bool:
+    """True for quota errors, whichever Google client raised them."""
+    # google.api_core ResourceExhausted and google.genai ClientError both carry `code`
+    return getattr(exc, "code", None) == 429 or "RESOURCE_EXHAUSTED" in str(exc)
+
+@retry(
+    wait=wait_random_exponential(multiplier=1, max=30),
+    stop=stop_after_attempt(6),
+    retry=retry_if_exception(_is_rate_limited),
+    reraise=True,
+)
+def llm_invoke(prompt, model: ChatGoogleGenerativeAI = llm_main):
+    """Invoke a shared LLM with exponential backoff + jitter on rate limits."""
+    return model.invoke(prompt)
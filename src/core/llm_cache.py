@@ -0,0 +1,51 @@
+import hashlib
+from functools import lru_cache
+from typing import Optional
+
+from diskcache import Cache
+
+from src.core.config import llm_classifier, llm_invoke
+
+# Persistent layer so repeated classifications survive process restarts
+_DISK_CACHE_DIR = ".2giants/llm_cache"
+_disk_cache: Optional[Cache] = None
+
+def _get_disk_cache() -> Cache:
+    """Open the on-disk cache on first use (keeps imports free of filesystem side effects)."""
+    global _disk_cache
+    if _disk_cache is None:
+        _disk_cache = Cache(_DISK_CACHE_DIR)
+    return _disk_cache
+
+def prompt_hash(prompt: str) -> str:
+    """Stable 128-bit key for a prompt."""
+    return hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()
+
+class _EmptyLabel(Exception):
+    """The model answered nothing: not a classification, so nothing is cached."""
+
+@lru_cache(maxsize=512)
+def _classify(prompt_hash: str, prompt: str) -> str:
+    disk_cache = _get_disk_cache()
+    label = disk_cache.get(prompt_hash)
+    if label:
+        return label
+
+    response = llm_invoke(prompt, model=llm_classifier)
+    label = response.text.strip().upper()
+    if not label:
+        # Raising keeps it out of lru_cache too: the next call asks the model again
+        raise _EmptyLabel()
+    disk_cache.set(prompt_hash, label)
+    return label
+
+def classify(prompt: str) -> str:
+    """
+    Single-word LLM classification (router / grader), memoized in memory and on disk.
+    Identical prompts cost one LLM call. Returns "" if the model gave no answer
+    (callers fall back to their default route); that case is never cached.
+    """
+    try:
+        return _classify(prompt_hash(prompt), prompt)
+    except _EmptyLabel:
+        return ""
@@ -1,30 +1,70 @@
 import sqlite3
-from typing import Any, Optional
+from typing import Any, Dict, Optional, Tuple
 from langgraph.checkpoint.sqlite import SqliteSaver
 from pathlib import Path
 
+# Connection tuning applied before handing the connection to SqliteSaver.
+# WAL + synchronous=NORMAL turns the per-step fsync into amortized group commits.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA wal_autocheckpoint=1000",
+)
+
 class SessionManager:
     """
     Manages persistence for LangGraph using SQLite.
     Enables 'Time Travel' by saving state at every step.
     """
+    # One (connection, saver) pair per database file, shared by every manager
+    # so repeated get_checkpointer() calls skip connection setup.
+    _instances: Dict[Path, Tuple[sqlite3.Connection, SqliteSaver]] = {}
+
     def __init__(self, db_path: str = ".2giants/sessions.db"):
         self.db_path = Path(db_path).resolve()
-        
+
     def setup(self):
         """Ensure the DB directory and connection exist."""
         if not self.db_path.parent.exists():
             self.db_path.parent.mkdir(parents=True, exist_ok=True)
-            
+
         # The connection will be managed by SqliteSaver
         # We just ensure the path is ready.
         return self.db_path
 
     def get_checkpointer(self) -> SqliteSaver:
         """Returns a configured SqliteSaver for the graph."""
-        self.setup()
-        conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
-        return SqliteSaver(conn)
+        cached = self._instances.get(self.db_path)
+        if cached is None:
+            self.setup()
+            conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            for pragma in SQLITE_PRAGMAS:
+                conn.execute(pragma)
+            cached = (conn, SqliteSaver(conn))
+            SessionManager._instances[self.db_path] = cached
+        return cached[1]
+
+    @property
+    def conn(self) -> Optional[sqlite3.Connection]:
+        """The shared connection for this DB, if a checkpointer was opened."""
+        cached = self._instances.get(self.db_path)
+        return cached[0] if cached else None
+
+    def checkpoint_wal(self) -> Optional[Tuple[int, int, int]]:
+        """
+        Fold the WAL back into the main DB and truncate it.
+        Returns the (busy, log, checkpointed) triple reported by SQLite.
+        busy=1 means a reader blocked the checkpoint; the WAL is left as is
+        and the next call will retry.
+        """
+        conn = self.conn
+        if conn is None:
+            return None
+        busy, log, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        return busy, log, checkpointed
 
     def list_sessions(self):
         """Not yet implemented: list available session threads."""
@@ -1,30 +1,34 @@
-from typing import Annotated, List, Dict, Optional, Any
-from typing_extensions import TypedDict
+from operator import add, or_
+from typing import Annotated, List, Dict, Optional, Any, Union
+from typing_extensions import NotRequired, TypedDict
 from langgraph.graph.message import add_messages
 
 class PlanStep(TypedDict):
-    id: str
+    id: Union[str, int]  # The LLM sometimes emits 1 instead of "1"; parse_plan normalizes to str
     description: str
-    command: Optional[str]
+    command: NotRequired[Optional[str]]  # Absent / empty for manual or thought steps
     risk_level: str  # "LOW", "MEDIUM", "HIGH", "CRITICAL"
-    status: str      # "pending", "in_progress", "done", "failed"
-    output: Optional[str]
+    status: NotRequired[str]  # "pending", "in_progress", "done", "failed" (live value in plan_status)
+    output: NotRequired[Optional[str]]
 
 class GlobalState(TypedDict):
     # Chat history with the user (Human + AI messages)
     messages: Annotated[List[dict], add_messages]
     
-    # The action plan
+    # The action plan (written once by the planner, then read-only)
     plan: List[PlanStep]
+
+    # Step id -> status, merged per update so nodes only send the changed step
+    plan_status: Annotated[Dict[str, str], or_]
     
     # Current execution pointer
     current_step_index: int
     
-    # Research findings
-    research_outputs: List[str]
+    # Research findings, append-only
+    research_outputs: Annotated[List[str], add]
     
-    # Raw execution logs (command + stdout/stderr)
-    execution_history: List[Dict[str, Any]]
+    # Raw execution logs (command + stdout/stderr), append-only
+    execution_history: Annotated[List[Dict[str, Any]], add]
     
     # Safety flag: has the user approved the CURRENT plan?
     user_validated: bool
@@ -1,5 +1,6 @@
 from typing import Dict, Literal
 from langchain_core.messages import SystemMessage
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
 
 from src.core.state import GlobalState
@@ -8,6 +9,19 @@ from src.tools.subprocess import SafeSubprocess
 # Initialize tools
 safe_runner = SafeSubprocess()
 
+# Per-stream cap on what is kept in execution_history (and thus every later checkpoint)
+MAX_HISTORY_OUTPUT = 8192
+
+def _truncate(text: str, limit: int = MAX_HISTORY_OUTPUT) -> str:
+    if len(text) <= limit:
+        return text
+    return text[:limit] + "...<truncated>"
+
+def step_status(state: GlobalState, idx: int) -> str:
+    """Current status of the step at `idx`, falling back to the planner's value."""
+    step = state["plan"][idx]
+    return state.get("plan_status", {}).get(step["id"], step.get("status", "pending"))
+
 def step_parser(state: GlobalState) -> Dict:
     """Node: Identifies the next step to execute."""
     plan = state["plan"]
@@ -16,12 +30,8 @@ def step_parser(state: GlobalState) -> Dict:
     if idx >= len(plan):
         return {"current_step_index": idx} # No updates, logic handled in edges
 
-    current_step = plan[idx]
-    # Update status to in_progress
-    current_step["status"] = "in_progress"
-    plan[idx] = current_step
-    
-    return {"plan": plan}
+    # Update status to in_progress (only the delta, the plan itself is untouched)
+    return {"plan_status": {plan[idx]["id"]: "in_progress"}}
 
 def safety_guard(state: GlobalState) -> Dict:
     """Node: Checks if the current command is safe to execute."""
@@ -41,63 +51,70 @@ def safety_guard(state: GlobalState) -> Dict:
     # Double check for extremely dangerous patterns essentially caught by SafeSubprocess
     # But here we can route to an error state or halt.
     if "rm -rf /" in command:
-        return {"plan": state["plan"]} # Will fail in runner or here
+        return {} # Will fail in runner or here
     
     return {} # Proceed
 
-def terminal_runner(state: GlobalState) -> Dict:
-    """Node: Executes the command."""
+def _runner_result(state: GlobalState, command, return_code: int, stdout: str, stderr: str) -> Dict:
+    """Builds terminal_runner's state delta for an executed command."""
     idx = state["current_step_index"]
-    plan = state["plan"]
-    step = plan[idx]
-    command = step.get("command")
-    
-    if not command:
-        # Step might be a thought or manual action
-        step["status"] = "done"
-        step["output"] = "(No command executed)"
-        plan[idx] = step
-        return {
-            "plan": plan, 
-            "current_step_index": idx + 1,
-            "execution_history": state.get("execution_history", []) + [{"command": None, "output": "Skipped (no command)"}]
-        }
-
-    return_code, stdout, stderr = safe_runner.run(command)
+    step = state["plan"][idx]
     
-    output = stdout + "\n" + stderr
     history_item = {
         "step_id": step["id"],
         "command": command,
         "return_code": return_code,
-        "output": output
+        "stdout": _truncate(stdout),
+        "stderr": _truncate(stderr)
     }
     
+    # Reducers on plan_status / execution_history: return only the delta
     if return_code == 0:
-        step["status"] = "done"
-        step["output"] = output
-        plan[idx] = step
         return {
-            "plan": plan, 
+            "plan_status": {step["id"]: "done"},
             "current_step_index": idx + 1,
-            "execution_history": state.get("execution_history", []) + [history_item]
+            "execution_history": [history_item]
         }
     else:
-        step["status"] = "failed"
-        step["output"] = output
-        plan[idx] = step
         return {
-            "plan": plan,
-            "execution_history": state.get("execution_history", []) + [history_item]
+            "plan_status": {step["id"]: "failed"},
+            "execution_history": [history_item]
         }
 
+def _skipped_result(state: GlobalState) -> Dict:
+    """Step might be a thought or manual action: nothing to run."""
+    idx = state["current_step_index"]
+    step = state["plan"][idx]
+    return {
+        "plan_status": {step["id"]: "done"},
+        "current_step_index": idx + 1,
+        "execution_history": [{"step_id": step["id"], "command": None, "stdout": "Skipped (no command)", "stderr": ""}]
+    }
+
+def terminal_runner(state: GlobalState) -> Dict:
+    """Node: Executes the command."""
+    command = state["plan"][state["current_step_index"]].get("command")
+    if not command:
+        return _skipped_result(state)
+
+    return_code, stdout, stderr = safe_runner.run(command)
+    return _runner_result(state, command, return_code, stdout, stderr)
+
+async def aterminal_runner(state: GlobalState) -> Dict:
+    """Node (async): Executes the command without blocking the event loop."""
+    command = state["plan"][state["current_step_index"]].get("command")
+    if not command:
+        return _skipped_result(state)
+
+    return_code, stdout, stderr = await safe_runner.arun(command)
+    return _runner_result(state, command, return_code, stdout, stderr)
+
 def error_handler(state: GlobalState) -> Dict:
     """Node: DECIDES what to do on error."""
     # Simple logic: Stop execution, return to user/planner.
     # In advanced: ask LLM for fix.
-    messages = state["messages"]
-    messages.append(SystemMessage(content=f"Execution failed at step {state['current_step_index'] + 1}."))
-    return {"messages": messages}
+    # add_messages appends, so only the new message is returned
+    return {"messages": [SystemMessage(content=f"Execution failed at step {state['current_step_index'] + 1}.")]}
 
 # --- Edges ---
 
@@ -106,8 +123,7 @@ def check_step_completion(state: GlobalState) -> Literal["terminal_runner", "end
     if idx >= len(state["plan"]):
         return "end"
     
-    step = state["plan"][idx]
-    if step["status"] == "failed":
+    if step_status(state, idx) == "failed":
         return "end" # Or error_handler
         
     return "terminal_runner"
@@ -130,13 +146,12 @@ def check_execution_result(state: GlobalState) -> Literal["step_parser", "error_
     # We can detect failure by looking if the status of the current step is 'failed'
     # (Because index didn't increment)
     
-    current_step = state["plan"][idx]
-    if current_step["status"] == "failed":
-        return "error_handler"
-        
     # If we moved past the end, we are done
     if idx >= len(state["plan"]):
         return "step_parser" # Loop back to see it's empty/done
+
+    if step_status(state, idx) == "failed":
+        return "error_handler"
         
     return "step_parser" 
 
@@ -145,7 +160,8 @@ def create_executor_graph():
     
     workflow.add_node("step_parser", step_parser)
     workflow.add_node("safety_guard", safety_guard)
-    workflow.add_node("terminal_runner", terminal_runner)
+    # Sync path for graph.stream, async path (non-blocking subprocess) for graph.astream
+    workflow.add_node("terminal_runner", RunnableLambda(terminal_runner, afunc=aterminal_runner))
     workflow.add_node("error_handler", error_handler)
     
     workflow.set_entry_point("step_parser")
@@ -1,6 +1,7 @@
-from typing import Dict, Literal
+import re
+from typing import Dict, Literal, Optional
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langgraph.graph import StateGraph, END
 
 from src.core.state import GlobalState
@@ -8,7 +9,34 @@ from src.graphs.planner import create_planner_graph
 from src.graphs.executor import create_executor_graph
 from src.graphs.researcher import create_researcher_graph
 
-from src.core.config import llm
+from src.core.config import llm_invoke
+from src.core.llm_cache import classify
+
+# Fast-path classification: obvious requests skip the LLM round-trip entirely
+_EXEC_RE = re.compile(r"^\s*(run|exec|create|delete|install|rm|mkdir|touch|edit|write|build|deploy)\b", re.I)
+_RESEARCH_RE = re.compile(r"^\s*(what|why|how|when|who|where|explain|compare|find)\b", re.I)
+_CHAT_RE = re.compile(r"^\s*(hi|hello|hey|thanks|thank you|thx|bye)\b[\s!.?]*$", re.I)
+
+ROUTER_TEMPLATE = """
+Classify the following user request into one of these categories:
+- EXECUTE: The user wants to perform an action (create files, run commands, edit code).
+- RESEARCH: The user is asking a question that requires web search or external knowledge.
+- CHAT: The user is saying hello, asking a clarification, or chatting casually.
+
+Request: {msg}
+
+Return ONLY the category name.
+"""
+
+def classify_fast(text: str) -> Optional[str]:
+    """Route target for unambiguous requests, or None to defer to the LLM."""
+    if _EXEC_RE.match(text):
+        return "planner"
+    if _RESEARCH_RE.match(text):
+        return "researcher"
+    if _CHAT_RE.match(text):
+        return "chat"
+    return None
 
 def router(state: GlobalState) -> Dict:
     """Node: Decides where to send the request."""
@@ -16,20 +44,14 @@ def router(state: GlobalState) -> Dict:
     last_msg = messages[-1].content
     if isinstance(last_msg, list):
          last_msg = " ".join([block["text"] for block in last_msg if "text" in block])
+
+    target = classify_fast(last_msg)
+    if target is not None:
+        return {"_route_target": target}
     
-    prompt = f"""
-    Classify the following user request into one of these categories:
-    - EXECUTE: The user wants to perform an action (create files, run commands, edit code).
-    - RESEARCH: The user is asking a question that requires web search or external knowledge.
-    - CHAT: The user is saying hello, asking a clarification, or chatting casually.
-    
-    Request: {last_msg}
-    
-    Return ONLY the category name.
-    """
+    prompt = ROUTER_TEMPLATE.format_map({"msg": last_msg})
     
-    response = llm.invoke(prompt)
-    category = response.text.strip().upper()
+    category = classify(prompt)
     
     # Simple mapping
     if "EXECUTE" in category:
@@ -44,9 +66,32 @@ def router(state: GlobalState) -> Dict:
 def chat_node(state: GlobalState) -> Dict:
     """Node: Handles simple conversation."""
     messages = state["messages"]
-    response = llm.invoke(messages)
+    response = llm_invoke(messages)
     return {"messages": [response]}
 
+# GlobalState keys merged with an append reducer (operator.add)
+_APPEND_KEYS = ("research_outputs", "execution_history")
+
+def subgraph_node(subgraph) -> RunnableLambda:
+    """
+    Wraps a compiled sub-graph as a node of the main graph.
+    A sub-graph returns its whole final state: append-only keys are cut down to
+    the entries it added, otherwise the reducer would append the old ones again.
+    """
+    def delta(state: GlobalState, result: Dict) -> Dict:
+        for key in _APPEND_KEYS:
+            if key in result:
+                result[key] = result[key][len(state.get(key) or []):]
+        return result
+
+    def node(state: GlobalState, config: RunnableConfig) -> Dict:
+        return delta(state, subgraph.invoke(state, config))
+
+    async def anode(state: GlobalState, config: RunnableConfig) -> Dict:
+        return delta(state, await subgraph.ainvoke(state, config))
+
+    return RunnableLambda(node, afunc=anode)
+
 # --- Edges ---
 
 def route_request(state: GlobalState) -> Literal["planner", "researcher", "chat_node"]:
@@ -60,9 +105,9 @@ def create_main_graph():
     workflow.add_node("chat_node", chat_node)
     
     # Sub-graphs
-    workflow.add_node("planner", create_planner_graph())
-    workflow.add_node("executor", create_executor_graph())
-    workflow.add_node("researcher", create_researcher_graph())
+    workflow.add_node("planner", subgraph_node(create_planner_graph()))
+    workflow.add_node("executor", subgraph_node(create_executor_graph()))
+    workflow.add_node("researcher", subgraph_node(create_researcher_graph()))
     
     # Entry Point
     workflow.set_entry_point("router")
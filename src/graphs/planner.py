@@ -1,13 +1,13 @@
+import re
 from typing import Dict, List, Literal
+import msgspec
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
 
 from src.core.state import GlobalState, PlanStep
-import json
 
-from src.core.config import llm
+from src.core.config import llm_invoke
 
 PLANNER_PROMPT = """
 You are an expert technical planner for a CLI Agent.
@@ -31,28 +31,67 @@ Example:
 ]
 """
 
+# Built once: the system prompt is identical for every planner call
+_PLANNER_SYS = SystemMessage(content=PLANNER_PROMPT)
+
+REFINER_TEMPLATE = """
+The user rejected the previous plan.
+Current Plan: {plan}
+User Feedback: {feedback}
+
+Update the plan accordingly. Return the full updated JSON array.
+"""
+
+# Markdown fences the LLM sometimes wraps around the JSON despite the prompt
+_FENCE_RE = re.compile(rb"```(?:json)?\s*|\s*```")
+
+def parse_plan(text: str) -> List[PlanStep]:
+    """
+    Decode and validate the LLM's JSON plan in one pass, defaulting status to pending
+    and normalizing step ids to str.
+    """
+    content = _FENCE_RE.sub(b"", text.encode()).strip()
+    plan_data = msgspec.json.decode(content, type=List[PlanStep])
+    for step in plan_data:
+        step["id"] = str(step["id"])
+        step.setdefault("status", "pending")
+    return plan_data
+
+def plan_to_prompt_json(plan: List[PlanStep]) -> str:
+    """Compact, key-sorted JSON of the fields the LLM needs (no status / output)."""
+    compact = [
+        {
+            "id": step["id"],
+            "description": step["description"],
+            "command": step.get("command"),
+            "risk_level": step["risk_level"]
+        }
+        for step in plan
+    ]
+    return msgspec.json.encode(compact, order="sorted").decode()
+
 def draft_plan(state: GlobalState) -> Dict:
     """Node: Generates the initial plan based on user messages."""
     messages = state["messages"]
     # Extract the user's objective from the messages
     # In a real scenario, we might summarization history
     
-    response = llm.invoke([
-        SystemMessage(content=PLANNER_PROMPT),
+    response = llm_invoke([
+        _PLANNER_SYS,
         *messages,
         HumanMessage(content="Generate a plan for the above request.")
     ])
     
     try:
-        # Clean up potential markdown wrapper from LLM
-        content = response.text.replace("```json", "").replace("```", "").strip()
-        plan_data = json.loads(content)
-        # Ensure default status
-        for step in plan_data:
-            if "status" not in step:
-                step["status"] = "pending"
+        plan_data = parse_plan(response.text)
         
-        return {"plan": plan_data, "current_step_index": 0, "user_validated": False}
+        return {
+            "plan": plan_data,
+            # Overwrite statuses left over from a previous plan with the same step ids
+            "plan_status": {step["id"]: step["status"] for step in plan_data},
+            "current_step_index": 0,
+            "user_validated": False
+        }
     except Exception as e:
         # Fallback or error handling
         return {
@@ -70,26 +109,24 @@ def plan_refiner(state: GlobalState) -> Dict:
     # Ideally human input is string, but being safe if needed, 
     # though usage says strict 'HumanMessage' is string.
     
-    feedback_prompt = f"""
-    The user rejected the previous plan. 
-    Current Plan: {json.dumps(state['plan'])}
-    User Feedback: {last_msg_content}
+    feedback_prompt = REFINER_TEMPLATE.format_map({
+        "plan": plan_to_prompt_json(state['plan']),
+        "feedback": last_msg_content
+    })
     
-    Update the plan accordingly. Return the full updated JSON array.
-    """
-    
-    response = llm.invoke([
-        SystemMessage(content=PLANNER_PROMPT),
+    response = llm_invoke([
+        _PLANNER_SYS,
         HumanMessage(content=feedback_prompt)
     ])
     
     try:
-        content = response.text.replace("```json", "").replace("```", "").strip()
-        plan_data = json.loads(content)
-        for step in plan_data:
-             if "status" not in step: step["status"] = "pending"
+        plan_data = parse_plan(response.text)
              
-        return {"plan": plan_data, "user_validated": False}
+        return {
+            "plan": plan_data,
+            "plan_status": {step["id"]: step["status"] for step in plan_data},
+            "user_validated": False
+        }
     except Exception as e:
         return {"messages": [SystemMessage(content=f"Error refining plan: {str(e)}")]}
 
@@ -1,5 +1,6 @@
 import os
 import glob
+import stat
 from typing import List, Optional, Dict
 from pathlib import Path
 
@@ -23,30 +24,34 @@ class FileSystemManager:
     def list_files(self, path: str = ".", depth: int = 1) -> str:
         """List files in a directory similar to 'ls -R' or 'tree'."""
         target_dir = self._resolve_path(path)
-        if not target_dir.exists():
-            return f"Error: Directory {path} does not exist."
         
         output = []
         try:
             # Simple non-recursive list for now, or limited recursion
-            # Using glob for easier pattern matching if needed later
-            items = os.listdir(target_dir)
+            # scandir reuses the dirent type: no extra stat per entry except for symlinks
             output.append(f"Directory listing for: {path}")
-            for item in items:
-                full_item = target_dir / item
-                is_dir = full_item.is_dir()
-                mark = "[DIR] " if is_dir else "[FILE]"
-                output.append(f"{mark} {item}")
+            with os.scandir(target_dir) as entries:
+                for entry in entries:
+                    mark = "[DIR] " if entry.is_dir() else "[FILE]"
+                    output.append(f"{mark} {entry.name}")
             return "\n".join(output)
+        except FileNotFoundError:
+            return f"Error: Directory {path} does not exist."
         except Exception as e:
             return f"Error listing files: {str(e)}"
 
     def read_file(self, path: str) -> str:
         """Read content of a file."""
         target = self._resolve_path(path)
-        if not target.exists():
+        # One stat call covers both the existence and the regular-file checks
+        try:
+            st = target.stat()
+        except (FileNotFoundError, NotADirectoryError):
+            # NotADirectoryError: a path component is a file ("README.md/x")
             return f"Error: File {path} not found."
-        if not target.is_file():
+        except OSError as e:
+            return f"Error reading file {path}: {str(e)}"
+        if not stat.S_ISREG(st.st_mode):
             return f"Error: {path} is not a file."
         
         try:
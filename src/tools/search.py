@@ -1,6 +1,20 @@
 import os
+import hashlib
+from diskcache import Cache
 from tavily import TavilyClient
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+
+# Search results are cached on disk: repeated queries during plan iteration hit instantly
+_CACHE_DIR = ".2giants/tavily_cache"
+_CACHE_TTL = 6 * 60 * 60  # 6 hours
+_cache: Optional[Cache] = None
+
+def _get_cache() -> Cache:
+    """Open the on-disk cache on first use."""
+    global _cache
+    if _cache is None:
+        _cache = Cache(_CACHE_DIR)
+    return _cache
 
 class TavilySearch:
     """
@@ -14,25 +28,34 @@ class TavilySearch:
              pass
         self.client = TavilyClient(api_key=api_key)
 
-    def search(self, query: str) -> str:
+    def search(self, query: str, search_depth: str = "advanced") -> str:
         """
         Perform a search and return formatted results.
+        Successful results are cached for 6 hours per (query, search_depth).
         """
+        key = hashlib.blake2b(f"{query}|{search_depth}".encode()).hexdigest()
+        cache = _get_cache()
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
         try:
             # search_depth="advanced" gives better results for dev topics
-            response = self.client.search(query=query, search_depth="advanced")
+            response = self.client.search(query=query, search_depth=search_depth)
             results = response.get("results", [])
-            
+
             formatted = []
             for res in results:
                 title = res.get('title', 'No Title')
                 content = res.get('content', '')
                 url = res.get('url', '')
                 formatted.append(f"Title: {title}\nSource: {url}\nContent: {content}\n")
-            
+
             if not formatted:
                 return "No results found."
-                
-            return "\n---\n".join(formatted)
+
+            output = "\n---\n".join(formatted)
+            cache.set(key, output, expire=_CACHE_TTL)
+            return output
         except Exception as e:
             return f"Search failed: {str(e)}. (Check TAVILY_API_KEY?)"
@@ -1,49 +1,477 @@
+import asyncio
+import functools
+import os
+import re
+import selectors
+import shutil
 import subprocess
 import shlex
-import threading
-from typing import Tuple, Optional
+import signal
+import stat
+import sys
+import time
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Iterator, List, Tuple, Optional, Union
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # Windows
+
+# Characters that need /bin/sh to interpret (pipes, redirects, globs, expansions...).
+# Commands without any of them are exec'd directly, without a shell process.
+_SHELL_META_RE = re.compile(r"[|&;<>*?$()`\\\n~#{}\[\]!]")
+
+# Builtins that only make sense inside a shell (some also exist as no-op binaries)
+_SHELL_BUILTINS = frozenset({
+    "cd", "export", "source", ".", "alias", "unalias", "set", "unset", "exec",
+    "eval", "ulimit", "umask", "read", "trap", "exit", "shift", "wait",
+})
+
+def _decode(data: bytes) -> str:
+    """
+    Decode child output in one pass; pure-ASCII output skips the UTF-8 state machine.
+    The 'replace' handler is only consulted on an invalid byte, so valid UTF-8
+    decodes at strict speed without a try-strict-first pass.
+    """
+    if data.isascii():
+        return data.decode('ascii')
+    return data.decode('utf-8', 'replace') # Prevent decoding errors from crashing
+
+# Pipe read size: the default Linux pipe capacity, page-aligned (raw fd reads bypass the io layer)
+CHUNK = 65536
+
+# Linux lets us enlarge the child's pipes so a fast producer blocks less often
+# between our reads (capped by /proc/sys/fs/pipe-max-size, 1 MiB by default)
+PIPE_SIZE = 1 << 20
+_F_SETPIPE_SZ = getattr(fcntl, "F_SETPIPE_SZ", 1031) if sys.platform.startswith("linux") else None
+
+def _grow_pipe(fd: int) -> None:
+    """Best effort: keep the default size if the kernel refuses."""
+    if _F_SETPIPE_SZ is None:
+        return
+    try:
+        fcntl.fcntl(fd, _F_SETPIPE_SZ, PIPE_SIZE)
+    except OSError:
+        pass
+
+# Time a timed-out command gets between SIGTERM and SIGKILL to flush and exit
+KILL_GRACE = 0.5
+# Time after SIGKILL to collect the last output and reap the child. A timed-out
+# command never holds the caller longer than timeout + KILL_GRACE + KILL_WAIT,
+# even if the child is stuck in uninterruptible sleep.
+KILL_WAIT = 1.0
+
+def _remaining(deadline: float) -> float:
+    """Seconds left before a monotonic deadline, floored so a late call still polls once."""
+    return max(0.1, deadline - time.monotonic())
+
+# Children get their own process group, so a timeout reaches the whole pipeline
+# and not just the shell running it
+_GROUP_KWARGS = (
+    {"start_new_session": True} if os.name == "posix"
+    else {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+)
+
+def _signal_group(pgid: int, sig: int) -> bool:
+    """Signal a whole process group; False if it is already gone."""
+    try:
+        os.killpg(pgid, sig)
+        return True
+    except (ProcessLookupError, PermissionError):
+        # PermissionError: only zombies left on some platforms (macOS)
+        return False
+
+# Output beyond max_output_bytes is dropped and the child killed: a runaway
+# command (`yes`, `cat /dev/urandom`) can't grow the agent's memory without bound.
+MAX_OUTPUT_BYTES = 8 * 1024 * 1024
+OUTPUT_TRUNCATED = "\n[OUTPUT TRUNCATED]"
+
+def _clip(out: bytes, err: bytes, limit: int) -> Tuple[bytes, bytes, bool]:
+    """Cap stdout + stderr at `limit` bytes in total, stdout first. Returns (out, err, truncated)."""
+    if len(out) + len(err) <= limit:
+        return out, err, False
+    out = out[:limit]
+    return out, err[:limit - len(out)], True
+
+_ERR_EXEC = "Execution failed: "
+
+@dataclass(repr=False)
+class SubprocessResult:
+    """
+    Outcome of a command. Output is kept as raw bytes and decoded on first access,
+    so a caller that only looks at `returncode` never pays for the decode.
+    Unpacks and indexes like the (return_code, stdout, stderr) tuple run() used to return.
+    """
+    returncode: int
+    stdout_bytes: bytes = b""
+    stderr_bytes: bytes = b""
+    # Message put before the child's stderr (e.g. the timeout notice)
+    error_prefix: str = ""
+    truncated: bool = False
+
+    @classmethod
+    def from_text(cls, returncode: int, stdout: str, stderr: str) -> "SubprocessResult":
+        """Result whose text is already a str (in-process commands, refusals, errors)."""
+        result = cls(returncode)
+        # Pre-fill the cached_property slots: nothing to decode
+        result.__dict__.update(stdout=stdout, stderr=stderr)
+        return result
+
+    @cached_property
+    def stdout(self) -> str:
+        return _decode(self.stdout_bytes)
+
+    @cached_property
+    def stderr(self) -> str:
+        stderr = self.error_prefix + _decode(self.stderr_bytes)
+        return stderr + OUTPUT_TRUNCATED if self.truncated else stderr
+
+    def __iter__(self) -> Iterator[Union[int, str]]:
+        yield self.returncode
+        yield self.stdout
+        yield self.stderr
+
+    def __getitem__(self, index):
+        return tuple(self)[index]
+
+    def __len__(self) -> int:
+        return 3
+
+    def __repr__(self) -> str:
+        return f"SubprocessResult(returncode={self.returncode!r}, stdout={self.stdout!r}, stderr={self.stderr!r})"
+
+def _read_into(fd: int, buf: bytearray, scratch: memoryview) -> int:
+    """
+    Append one read from `fd` to `buf` through a reusable scratch buffer
+    (no intermediate bytes object per chunk). Returns the byte count, 0 at EOF.
+    """
+    n = os.readv(fd, [scratch])
+    buf += scratch[:n]
+    return n
+
+# --- In-process replacements for trivial commands ---
+# Each handler receives argv[1:] and the output budget (max_output_bytes), and returns
+# (return_code, stdout, stderr), or None when it does not support the given flags or
+# input and the real program should run. Handlers never block: anything that could
+# (FIFOs, devices, files over budget) goes to the real program, under its timeout and cap.
+
+InProcessResult = Optional[Tuple[int, str, str]]
+
+def _has_flags(args: List[str]) -> bool:
+    return any(arg.startswith("-") for arg in args)
+
+def _pwd(args: List[str], max_bytes: int) -> InProcessResult:
+    if args:
+        return None
+    return 0, os.getcwd() + "\n", ""
+
+def _echo(args: List[str], max_bytes: int) -> InProcessResult:
+    if args and args[0].startswith("-"):
+        return None # -n / -e / -E
+    return 0, " ".join(args) + "\n", ""
+
+def _c_collation() -> bool:
+    """True if a child would sort names by codepoint (C / POSIX collation, as sorted() does)."""
+    # Same precedence as setlocale(): LC_ALL, then LC_COLLATE, then LANG
+    name = os.environ.get("LC_ALL") or os.environ.get("LC_COLLATE") or os.environ.get("LANG") or "C"
+    return name in ("C", "POSIX") or name.startswith("C.")
+
+def _ls(args: List[str], max_bytes: int) -> InProcessResult:
+    # Other locales sort names by collation ("a B C _x"): leave those to the real ls
+    if _has_flags(args) or len(args) > 1 or not _c_collation():
+        return None
+    path = args[0] if args else "."
+    try:
+        if not os.path.isdir(path):
+            os.stat(path)
+            return 0, path + "\n", ""
+        names = sorted(name for name in os.listdir(path) if not name.startswith("."))
+    except FileNotFoundError:
+        return 2, "", f"ls: cannot access '{path}': No such file or directory\n"
+    except OSError:
+        return None
+    return 0, "".join(name + "\n" for name in names), ""
+
+def _regular_file_size(path: str) -> Optional[int]:
+    """Size of `path` if it is a regular file, else None. Raises FileNotFoundError."""
+    st = os.stat(path)
+    return st.st_size if stat.S_ISREG(st.st_mode) else None
+
+def _cat(args: List[str], max_bytes: int) -> InProcessResult:
+    if not args or _has_flags(args):
+        return None
+    out, err, return_code = [], [], 0
+    budget = max_bytes
+    for path in args:
+        try:
+            size = _regular_file_size(path)
+            if size is None or size > budget:
+                return None # Directory, FIFO, device or too big: real cat
+            with open(path, "rb") as f:
+                data = f.read(budget + 1)
+        except FileNotFoundError:
+            err.append(f"cat: {path}: No such file or directory\n")
+            return_code = 1
+            continue
+        except OSError:
+            return None
+        if len(data) > budget:
+            return None # Grew since the stat
+        budget -= len(data)
+        out.append(data)
+    return return_code, _decode(b"".join(out)), "".join(err)
+
+def _wc(args: List[str], max_bytes: int) -> InProcessResult:
+    if len(args) != 2 or args[0] != "-l":
+        return None # Only the single-file `wc -l FILE` form
+    path = args[1]
+    try:
+        size = _regular_file_size(path)
+        if size is None or size > max_bytes:
+            return None # FIFO, device or big file: real wc, under the timeout
+        with open(path, "rb") as f:
+            lines = sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(65536), b""))
+    except FileNotFoundError:
+        return 1, "", f"wc: {path}: No such file or directory\n"
+    except OSError:
+        return None
+    return 0, f"{lines} {path}\n", ""
+
+def _which(args: List[str], max_bytes: int) -> InProcessResult:
+    if not args or _has_flags(args):
+        return None
+    found = [shutil.which(name) for name in args]
+    out = "".join(path + "\n" for path in found if path)
+    return (0 if all(found) else 1), out, ""
 
 class SafeSubprocess:
-    def __init__(self, default_timeout: int = 60):
+    # Forbidden patterns compiled once: a single case-insensitive pass over the command
+    _FORBIDDEN_RE = re.compile(r"rm\s+-rf\s+/|format\s+c:|rd\s+/s\s+/q\s+c:\\", re.I)
+
+    # Commands answered without spawning anything (no fork, no exec, no pipes)
+    _INPROCESS = {
+        "pwd": _pwd,
+        "echo": _echo,
+        "ls": _ls,
+        "cat": _cat,
+        "wc": _wc,
+        "which": _which,
+    }
+
+    def __init__(self, default_timeout: int = 60, max_output_bytes: int = MAX_OUTPUT_BYTES):
         self.default_timeout = default_timeout
+        self.max_output_bytes = max_output_bytes
+        # The shell / direct-exec decision (shlex.split + PATH lookup) costs tens of µs;
+        # agents repeat the same commands, so it is memoized per command and PATH.
+        self._resolve = functools.lru_cache(maxsize=256)(self._resolve_direct_args)
 
-    def run(self, command: str, timeout: Optional[int] = None) -> Tuple[int, str, str]:
-        """
-        Executes a shell command safely with a timeout.
-        Returns: (return_code, stdout, stderr)
-        """
+    def _check_forbidden(self, command: str) -> Optional[str]:
+        """Returns the error message if the command is blocked, else None."""
         # Security check: basic strict blocking of obviously dangerous commands not caught by LLM
         # NOTE: The primary safety check should be in the SafetyGuard node.
         # This is a last-resort fail-safe.
         # Windows/Linux agnostic basic checks.
-        forbidden_patterns = ["rm -rf /", "format c:", "rd /s /q c:\\"] 
-        for pattern in forbidden_patterns:
-            if pattern in command.lower():
-                return -1, "", f"CRITICAL SECURITY: Command blocked by SafeSubprocess: {command}"
+        # Every forbidden pattern contains an "r" (rm / format / rd): commands without
+        # one skip the regex scan, a substring test is a single C-level pass.
+        if ("r" in command or "R" in command) and self._FORBIDDEN_RE.search(command):
+            return f"CRITICAL SECURITY: Command blocked by SafeSubprocess: {command}"
+        return None
+
+    def _direct_args(self, command: str) -> Optional[Tuple[str, List[str]]]:
+        """(executable, argv) if the command needs no shell features, else None."""
+        if os.name != "posix" or _SHELL_META_RE.search(command):
+            return None
+        return self._resolve(command, os.environ.get("PATH"))
+
+    def _resolve_direct_args(self, command: str, path: Optional[str]) -> Optional[Tuple[str, List[str]]]:
+        # `path` is only part of the cache key: shutil.which reads PATH itself
+        try:
+            args = shlex.split(command)
+        except ValueError:
+            # Unbalanced quotes: let the shell report it
+            return None
+        if not args or args[0] in _SHELL_BUILTINS or "=" in args[0]:
+            # Builtin, or a "VAR=value cmd" environment prefix
+            return None
+        executable = shutil.which(args[0])
+        if executable is None:
+            # Unknown program: the shell gives the usual "not found" / 127
+            return None
+        return executable, args
+
+    def run(self, command: str, timeout: Optional[int] = None) -> SubprocessResult:
+        """
+        Executes a shell command safely with a timeout.
+        Returns: SubprocessResult, unpackable as (return_code, stdout, stderr)
+        """
+        blocked = self._check_forbidden(command)
+        if blocked:
+            return SubprocessResult.from_text(-1, "", blocked)
 
         timeout_val = timeout if timeout is not None else self.default_timeout
 
+        # Bytes pipes: no incremental TextIOWrapper decoding, one bulk decode at the end
+        popen_kwargs = dict(
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            **_GROUP_KWARGS,
+        )
+
         try:
-            # shell=True is needed for complex commands (pipes, redirects) but adds risk.
-            # We mitigate this by validating inputs in the Agent graph upstream.
-            process = subprocess.Popen(
-                command,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding='utf-8',
-                errors='replace' # Prevent decoding errors from crashing
-            )
+            direct = self._direct_args(command)
+            if direct is not None:
+                handler = self._INPROCESS.get(direct[1][0])
+                if handler is not None:
+                    result = handler(direct[1][1:], self.max_output_bytes)
+                    if result is not None:
+                        return_code, stdout, stderr = result
+                        # Same clipping as spawned commands (stdout + stderr can exceed the cap)
+                        return self._result(return_code, stdout.encode(), stderr.encode())
+
+                # Plain "program args..." command: exec it directly, saving the /bin/sh
+                # fork+exec. CPython spawns it with vfork: start_new_session rules out
+                # posix_spawn, and close_fds walks /proc/self/fd (open fds, not RLIMIT_NOFILE).
+                executable, args = direct
+                process = subprocess.Popen(args, executable=executable, **popen_kwargs)
+            else:
+                # shell=True is needed for complex commands (pipes, redirects) but adds risk.
+                # We mitigate this by validating inputs in the Agent graph upstream.
+                process = subprocess.Popen(command, shell=True, **popen_kwargs)
 
+            if os.name != "posix":
+                # selectors cannot poll pipes on Windows: communicate() uses reader threads there
+                try:
+                    return self._communicate(process, timeout_val)
+                except BaseException:
+                    process.kill() # Own process group: Ctrl-C didn't reach it
+                    raise
+
+            _grow_pipe(process.stdout.fileno())
+            _grow_pipe(process.stderr.fileno())
+            out, err = bytearray(), bytearray()
+            deadline = time.monotonic() + timeout_val
             try:
-                stdout, stderr = process.communicate(timeout=timeout_val)
-                return process.returncode, stdout, stderr
-            except subprocess.TimeoutExpired:
-                process.kill()
-                # Try to get partial output
-                outs, errs = process.communicate()
-                return 124, outs or "", f"Command timed out after {timeout_val}s. {errs or ''}"
+                if self._drain(process, out, err, deadline):
+                    try:
+                        process.wait(timeout=max(deadline - time.monotonic(), 0))
+                        return self._result(process.returncode, out, err)
+                    except subprocess.TimeoutExpired:
+                        pass # Closed its pipes but kept running
+                elif len(out) + len(err) > self.max_output_bytes:
+                    # Runaway output: kill right away, no grace period
+                    _signal_group(process.pid, signal.SIGKILL)
+                    try:
+                        process.wait(timeout=KILL_WAIT)
+                    except subprocess.TimeoutExpired:
+                        pass
+                    # Always -SIGKILL, even if the child exited just before the kill:
+                    # the output was cut either way, same code on every path
+                    return self._result(-signal.SIGKILL, out, err)
+
+                # SIGTERM first so well-behaved programs flush their output; keep
+                # draining meanwhile so nothing blocks on a full pipe.
+                # Every step below is bounded by the original deadline.
+                _signal_group(process.pid, signal.SIGTERM)
+                grace = deadline + KILL_GRACE
+                if self._drain(process, out, err, grace):
+                    try:
+                        process.wait(timeout=_remaining(grace))
+                    except subprocess.TimeoutExpired:
+                        pass
+                _signal_group(process.pid, signal.SIGKILL)
+                # Collect what was flushed before the kill, without blocking on
+                # pipes that a surviving grandchild still holds open.
+                end = grace + KILL_WAIT
+                self._drain(process, out, err, end)
+                try:
+                    process.wait(timeout=_remaining(end))
+                except subprocess.TimeoutExpired:
+                    pass # Unkillable (D state): give up on reaping rather than hang
+                return self._result(124, out, err, f"Command timed out after {timeout_val}s. ")
+            except BaseException:
+                # KeyboardInterrupt & co: the child is in its own session, a terminal
+                # Ctrl-C never reached it. Don't leave it running behind the CLI.
+                _signal_group(process.pid, signal.SIGKILL)
+                raise
+            finally:
+                process.stdout.close()
+                process.stderr.close()
 
         except Exception as e:
-            return -1, "", f"Execution failed: {str(e)}"
+            return SubprocessResult.from_text(-1, "", _ERR_EXEC + type(e).__name__ + ": " + str(e))
+
+    def _result(self, return_code: int, out: bytes, err: bytes, error_prefix: str = "") -> SubprocessResult:
+        """Package the captured output, clipped to max_output_bytes (decoding is deferred)."""
+        out, err, truncated = _clip(out, err, self.max_output_bytes)
+        return SubprocessResult(return_code, out, err, error_prefix, truncated)
+
+    def _drain(self, process: subprocess.Popen, out: bytearray, err: bytearray, deadline: float) -> bool:
+        """
+        Read stdout/stderr into the buffers on one thread until both hit EOF
+        (returns True), or the monotonic deadline passes or the output exceeds
+        max_output_bytes (returns False).
+        """
+        buffers = {process.stdout.fileno(): out, process.stderr.fileno(): err}
+        scratch = memoryview(bytearray(CHUNK))
+        with selectors.DefaultSelector() as selector:
+            for fd in buffers:
+                selector.register(fd, selectors.EVENT_READ)
+            while selector.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                for key, _ in selector.select(remaining):
+                    if not _read_into(key.fd, buffers[key.fd], scratch):
+                        selector.unregister(key.fd)
+                if len(out) + len(err) > self.max_output_bytes:
+                    return False
+        return True
+
+    def _communicate(self, process: subprocess.Popen, timeout_val: int) -> SubprocessResult:
+        """
+        communicate()-based wait, for platforms where pipes can't be polled.
+        Output is only clipped afterwards here: communicate() can't stop early.
+        """
+        deadline = time.monotonic() + timeout_val
+        try:
+            stdout, stderr = process.communicate(timeout=timeout_val)
+            return self._result(process.returncode, stdout, stderr)
+        except subprocess.TimeoutExpired:
+            # CTRL_BREAK reaches the whole process group and lets it exit cleanly
+            grace = deadline + KILL_GRACE
+            try:
+                process.send_signal(signal.CTRL_BREAK_EVENT)
+                outs, errs = process.communicate(timeout=_remaining(grace))
+                return self._result(124, outs or b"", errs or b"", f"Command timed out after {timeout_val}s. ")
+            except (subprocess.TimeoutExpired, OSError):
+                pass
+            process.kill()
+            # Try to get partial output. communicate() keeps what it read before
+            # timing out; a short second timeout collects it without blocking
+            # forever on pipes that a surviving grandchild still holds open.
+            end = grace + KILL_WAIT
+            try:
+                process.wait(timeout=_remaining(end))
+                outs, errs = process.communicate(timeout=_remaining(end))
+            except (subprocess.TimeoutExpired, OSError):
+                outs, errs = b"", b""
+            return self._result(124, outs or b"", errs or b"", f"Command timed out after {timeout_val}s. ")
+
+    async def arun(self, command: str, timeout: Optional[int] = None) -> SubprocessResult:
+        """
+        Async variant of run(): awaits the command without blocking the event loop.
+        Runs run() on a worker thread, so both behave the same (direct exec,
+        in-process commands, output cap, partial output on timeout).
+        Returns: SubprocessResult, unpackable as (return_code, stdout, stderr)
+        """
+        return await asyncio.to_thread(self.run, command, timeout)
+
+    async def run_many(self, commands: List[str], timeout: Optional[int] = None) -> List[SubprocessResult]:
+        """
+        Runs independent commands concurrently on one event loop.
+        Results are returned in the order of `commands`.
+        Concurrency is bounded by the event loop's default thread pool.
+        """
+        return list(await asyncio.gather(*(self.arun(command, timeout) for command in commands)))